@@ -1 +1,6 @@
 from .newt import NEWT
+
+try:
+    from .aio import AsyncNEWT
+except ImportError:  # aiohttp/aiofiles are optional
+    pass
@@ -0,0 +1,355 @@
+import asyncio
+import os
+
+import aiohttp
+import aiofiles
+
+from .newt import NEWT_BASE_URL, _check_machine, _loads
+
+
+class AsyncNEWT:
+    """ Asynchronous NEWT client built on aiohttp
+
+    Credentials are stored at construction and the aiohttp session is
+    created lazily so the class can be instantiated outside a running
+    event loop. Use as an async context manager to login/logout
+    automatically:
+
+        async with AsyncNEWT(username, password) as newt:
+            results = await asyncio.gather(*[newt.list('edison', d) for d in dirs])
+    """
+    def __init__(self, username, password):
+        self._username = username
+        self._password = password
+        self._session = None
+
+    def _ensure_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar())
+        return self._session
+
+    async def close(self):
+        """ Close the underlying aiohttp session """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            await self.logout()
+        finally:
+            await self.close()
+
+    async def login(self):
+        """ Login user with password at NERSC for newt API """
+        session = self._ensure_session()
+        url = NEWT_BASE_URL + '/login'
+        async with session.post(url, data={"username": self._username,
+                                           "password": self._password}) as resp:
+            resp.raise_for_status()
+            data = await resp.json(loads=_loads)
+        if data['auth'] and data['username'] == self._username:
+            return data['auth']
+        raise ValueError('Could not get authorized connection to NEWT!')
+
+    async def logout(self):
+        """ Logout user """
+        session = self._ensure_session()
+        url = NEWT_BASE_URL + '/logout'
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            data = await resp.json(loads=_loads)
+        return not data['auth']
+
+    async def is_auth(self):
+        """ Checks if user is authenticated """
+        session = self._ensure_session()
+        url = NEWT_BASE_URL + '/auth'
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            data = await resp.json(loads=_loads)
+        return data['auth']
+
+    # Status API
+    async def status(self, system=None):
+        """ Get status of system at NERSC
+
+        Args:
+           system: system at NERSC
+        """
+        session = self._ensure_session()
+        url = NEWT_BASE_URL + '/status'
+        if system:
+            url = f'{url}/{system}'
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=_loads)
+
+    async def motd(self):
+        """ Get the message of the day at NERSC """
+        session = self._ensure_session()
+        url = NEWT_BASE_URL + '/status/motd'
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.text()
+
+    # File API
+    async def list(self, machine, remote_dir):
+        """ List the contents of a directory at NERSC
+
+        Args:
+           machine: one of the available machines at NERSC
+           remote_dir: path directory
+        """
+        _check_machine(machine)
+
+        session = self._ensure_session()
+        url = f'{NEWT_BASE_URL}/file/{machine}{remote_dir}'
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=_loads)
+
+    async def download(self, machine, remote_path, local_path=None):
+        """ Download a file from NERSC
+
+        Args:
+           machine: one of the available machines at NERSC
+           remote_path: path to file to download
+           local_path: path to save file
+                       (default: local directory with remote_path filename)
+        """
+        _check_machine(machine)
+
+        if not local_path:
+            local_path = remote_path.split('/')[-1]
+
+        session = self._ensure_session()
+        url = f'{NEWT_BASE_URL}/file/{machine}{remote_path}'
+        async with session.get(url, params={'view': 'read'}) as resp:
+            resp.raise_for_status()
+            async with aiofiles.open(local_path, 'wb') as f:
+                async for chunk in resp.content.iter_chunked(1 << 16):
+                    await f.write(chunk)
+        return local_path
+
+    async def download_many(self, items, max_workers=16, on_progress=None):
+        """ Download many files concurrently over the shared session
+
+        Args:
+           items: iterable of (machine, remote_path, local_path) triples
+                  (local_path may be None for the default)
+           max_workers: number of concurrent downloads
+           on_progress: optional callable invoked with each local path
+                        as its download completes
+
+        Output:
+           List of local paths in the order of items
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(machine, remote_path, local_path):
+            async with semaphore:
+                local_path = await self.download(machine, remote_path, local_path)
+            if on_progress:
+                on_progress(local_path)
+            return local_path
+
+        return await asyncio.gather(*[fetch(machine, remote_path, local_path)
+                                      for machine, remote_path, local_path in items])
+
+    async def upload(self, machine, remote_path, file_obj):
+        """ Upload a file to NERSC
+
+        Args:
+           machine: one of the available machines at NERSC
+           remote_path: path to directory to store upload
+           file_obj: file() object to upload
+        """
+        _check_machine(machine)
+
+        remote_dir, remote_filename = os.path.split(remote_path)
+        data = aiohttp.FormData()
+        data.add_field('file', file_obj,
+                       filename=remote_filename or file_obj.name)
+
+        session = self._ensure_session()
+        url = f'{NEWT_BASE_URL}/file/{machine}{remote_dir}'
+        async with session.post(url, data=data) as resp:
+            resp.raise_for_status()
+        return True
+
+    # Command API
+    async def run_command(self, machine, command, loginenv=True):
+        """Run command as username with or without shell environment. Note
+        that running with the login environment takes additional
+        time. Must be authorized.
+
+        Args:
+           machine: one of the available machines at NERSC
+           command: commnad to run with arguments
+        """
+        _check_machine(machine)
+
+        session = self._ensure_session()
+        url = f'{NEWT_BASE_URL}/command/{machine}'
+        async with session.post(url, data={'executable': command,
+                                           'loginenv': str(loginenv)}) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=_loads)
+
+    # Queue API
+    async def queue_stat(self, machine, index=0, limit=10, **kwargs):
+        """ Get the results of a qstat on a given machine at NERSC
+
+        Args:
+            machine: one of the available machines at NERSC
+            index: starting index of jobs in queue to list
+            limit: number of jobs to show
+            kwargs: additional keypairs to search (eg. queue=medium)
+        """
+        _check_machine(machine)
+
+        session = self._ensure_session()
+        url = f'{NEWT_BASE_URL}/queue/{machine}'
+        params = {'index': index, 'limit': limit}
+        params.update(kwargs)
+        async with session.get(url, params=params) as resp:
+            resp.raise_for_status()
+            job_infos = await resp.json(loads=_loads)
+        return [AsyncJob(session, **job_info) for job_info in job_infos]
+
+    async def queue_submit(self, machine, jobscript, jobfile=None):
+        """Submit job to cluser (if jobfile is not None simply submit file on
+        NERSC cluster
+
+        Args:
+           machine: one of the available machines at NERSC
+           jobscript: String|file of submission file
+           jobfile: remote path to jobfile to submit (will ignore jobscript is not none)
+        """
+        _check_machine(machine)
+
+        if hasattr(jobscript, 'read'):
+            job = jobscript.read()
+        else:
+            job = jobscript
+
+        if jobfile:
+            data = {'jobscript': '', 'jobfile': jobfile}
+        else:
+            data = {'jobscript': job, 'jobfile': ''}
+
+        session = self._ensure_session()
+        url = f'{NEWT_BASE_URL}/queue/{machine}'
+        async with session.post(url, data=data) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=_loads)
+
+
+class AsyncJob:
+    """ Represents a submitted job at NERSC (asynchronous variant)
+
+    See newt.newt.Job for the attributes stored on each job.
+    """
+    def __init__(self, session, **kwargs):
+        self._session = session
+        self._data = kwargs
+
+    def __getattr__(self, attr):
+        return self._data[attr]
+
+    def _apply(self, job_info):
+        """ Set each field of a queue response row onto the job """
+        for key in job_info:
+            setattr(self, key, job_info[key])
+
+    async def update(self):
+        """ Give the current status of job """
+        jobid = self.jobid.split('.')[0]
+        machine = self.hostname
+
+        url = f'{NEWT_BASE_URL}/queue/{machine}/{jobid}'
+        async with self._session.get(url) as resp:
+            resp.raise_for_status()
+            job_info = await resp.json(loads=_loads)
+        self._apply(job_info)
+        return job_info
+
+    async def delete(self):
+        """ delete job from queue at NERSC """
+        jobid = self.jobid.split('.')[0]
+        machine = self.hostname
+
+        url = f'{NEWT_BASE_URL}/queue/{machine}/{jobid}'
+        async with self._session.delete(url) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=_loads)
+
+
+class JobPoller:
+    """ Coalesces concurrent job polls into batched NEWT calls
+
+    Concurrent update() awaits that arrive within the coalescing window
+    are grouped by hostname and fetched with one comma-joined jobid
+    request per machine:
+
+        poller = JobPoller(session)
+        await asyncio.gather(*[poller.update(job) for job in jobs])
+
+    Args:
+       session: authenticated aiohttp session shared by the jobs
+       window: seconds to wait for more polls before flushing
+    """
+    def __init__(self, session, window=0.05):
+        self._session = session
+        self._window = window
+        self._pending = []
+        self._flush_task = None
+
+    async def update(self, job):
+        """ Update job status, batched with any concurrent polls """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((job, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self):
+        await asyncio.sleep(self._window)
+        pending, self._pending = self._pending, []
+        self._flush_task = None
+
+        by_machine = {}
+        for job, future in pending:
+            by_machine.setdefault(job.hostname, []).append((job, future))
+
+        for machine, machine_jobs in by_machine.items():
+            by_jobid = {job.jobid.split('.')[0]: (job, future)
+                        for job, future in machine_jobs}
+            url = f"{NEWT_BASE_URL}/queue/{machine}/{','.join(by_jobid)}"
+            try:
+                async with self._session.get(url) as resp:
+                    resp.raise_for_status()
+                    rows = await resp.json(loads=_loads)
+            except Exception as exc:
+                for job, future in machine_jobs:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            if isinstance(rows, dict): # single-jobid requests return one row
+                rows = [rows]
+            for row in rows:
+                entry = by_jobid.get(str(row.get('jobid', '')).split('.')[0])
+                if entry:
+                    job, future = entry
+                    job._apply(row)
+                    if not future.done():
+                        future.set_result(row)
+            for job, future in machine_jobs:
+                if not future.done():
+                    future.set_result(None)
@@ -1,15 +1,7 @@
-from distutils.core import setup
-import os
+from setuptools import setup, find_packages
 
 long_description = """ newt-python is a thin pythonic wrapper arround the NEWT NERSC api """
 
-packages = []
-for dirname, diranmes, filenames in os.walk('newt'):
-    if '__init__.py' in filenames:
-        packages.append(dirname.replace('/', '.'))
-
-package_dir = {'newt': 'newt'}
-
 setup(name='newt',
       version="0.0.1",
       description='NEWT NERSC API',
@@ -18,6 +10,12 @@ setup(name='newt',
       maintainer_email='chris.ostrouchov+newt@gmail.com',
       license='LGPLv2.1+',
       platforms=['linux'],
-      packages=packages,
-      package_dir=package_dir,
+      packages=find_packages(include=['newt', 'newt.*']),
+      python_requires='>=3.8',
+      install_requires=['requests>=2.28'],
+      extras_require={
+          'async': ['aiohttp', 'aiofiles'],
+          'fast': ['orjson', 'requests_toolbelt', 'isal'],
+          'http2': ['httpx[http2]'],
+      },
       long_description=long_description)